@@ -15,16 +15,201 @@ References:
   method. SIAM Journal on Optimization, 9(2), 504-525.
 """
 
-from cvxpy import lambda_min
-from scipy.optimize import newton
+import collections
+import math
 import numpy as np
 import scipy.linalg
-import matplotlib.pyplot as plt
+
+# Dimension up to which Hessians are diagonalized in closed form instead of calling LAPACK
+SMALL_EIGH_MAX_DIM = 3
+# Dimension up to which the trust region Newton iterations run on Python floats instead of numpy arrays
+SCALAR_MAX_DIM = 8
+
+
+class _HashCache:
+    """
+    Remember the values of a function at the last few points it was evaluated at, keyed on the bytes of the point.
+    The returned values are shared between calls and must not be modified in place.
+    """
+    def __init__(self, fun, size=2):
+        """
+        :param fun: Function of a numpy array
+        :param size: Number of points to remember
+        """
+        self.fun = fun
+        self.size = size
+        self._values = collections.OrderedDict()
+
+    def __call__(self, x):
+        if not isinstance(x, np.ndarray):
+            return self.fun(x)
+        key = (x.dtype.str, x.shape, x.tobytes())
+        try:
+            self._values.move_to_end(key)
+            return self._values[key]
+        except KeyError:
+            value = self.fun(x)
+            self._values[key] = value
+            if len(self._values) > self.size:
+                self._values.popitem(last=False)
+            return value
+
+
+def _eigh_small(H):
+    """
+    Diagonalize a symmetric matrix of dimension at most SMALL_EIGH_MAX_DIM in closed form
+    :param H: Symmetric matrix
+    :return: Lambda: Eigenvalues of H in ascending order
+    :return: U: Orthonormal eigenvectors of H, column i corresponds to Lambda[i]
+    """
+    n = H.shape[0]
+    if n == 1:
+        return np.array([H[0, 0]], dtype=float), np.ones((1, 1))
+    if n == 2:
+        a, b, d = H[0, 0], H[0, 1], H[1, 1]
+        t = 0.5*(a+d)
+        r = np.hypot(0.5*(a-d), b)
+        # The rotation by theta = atan2(2b, a-d)/2 diagonalizes H, (cos, sin) is the eigenvector of t+r
+        theta = 0.5*np.arctan2(2*b, a-d)
+        c, s = np.cos(theta), np.sin(theta)
+        return np.array([t-r, t+r]), np.array([[-s, c], [c, s]])
+    # Trigonometric solution of the characteristic polynomial of B = (H-qI)/p, see Smith (1961),
+    # in scalar arithmetic since numpy calls on 3x3 arrays are dominated by their overhead
+    (a, b, c), (_, d, e), (_, _, f) = H.tolist()
+    # Solved for H divided by its largest entry, so that the cubes and squares below neither underflow nor overflow
+    scale = max(abs(a), abs(b), abs(c), abs(d), abs(e), abs(f))
+    if scale == 0:
+        return np.zeros(3), np.identity(3)
+    a, b, c, d, e, f = a/scale, b/scale, c/scale, d/scale, e/scale, f/scale
+    q = (a+d+f)/3
+    p = math.sqrt(((a-q)**2 + (d-q)**2 + (f-q)**2 + 2*(b*b+c*c+e*e))/6)
+    if p == 0:
+        return np.full(3, q*scale), np.identity(3)
+    det_B = ((a-q)*((d-q)*(f-q)-e*e) - b*(b*(f-q)-e*c) + c*(b*e-(d-q)*c))/p**3
+    phi = math.acos(min(max(det_B/2, -1), 1))/3
+    lambda_max = q + 2*p*math.cos(phi)
+    lambda_min = q + 2*p*math.cos(phi + 2*math.pi/3)
+    # The eigenvector of an eigenvalue is orthogonal to the rows of H-lambda*I, take the largest cross product
+    # of two of its rows, the middle eigenvector completes the orthonormal basis
+    vecs = []
+    for l in (lambda_min, lambda_max):
+        r0, r1, r2 = (a-l, b, c), (b, d-l, e), (c, e, f-l)
+        v = max((_cross(r0, r1), _cross(r1, r2), _cross(r2, r0)), key=lambda w: w[0]*w[0]+w[1]*w[1]+w[2]*w[2])
+        norm = math.sqrt(v[0]*v[0]+v[1]*v[1]+v[2]*v[2])
+        # The cross products vanish with the gaps between the eigenvalues, close eigenvalues are left to LAPACK
+        if norm <= 1e-4*p*p:
+            return scipy.linalg.eigh(H, driver='evd')
+        vecs.append((v[0]/norm, v[1]/norm, v[2]/norm))
+    Lambda = scale*np.array([lambda_min, 3*q-lambda_min-lambda_max, lambda_max])
+    U = np.array([vecs[0], _cross(vecs[1], vecs[0]), vecs[1]]).T
+    return Lambda, U
+
+
+def _eigh(H):
+    """
+    Diagonalize a symmetric matrix, in closed form if its dimension is at most SMALL_EIGH_MAX_DIM
+    :param H: Symmetric matrix
+    :return: Lambda: Eigenvalues of H in ascending order
+    :return: U: Orthonormal eigenvectors of H, column i corresponds to Lambda[i]
+    """
+    if H.shape[0] <= SMALL_EIGH_MAX_DIM:
+        return _eigh_small(H)
+    # Divide and conquer driver for the full decomposition
+    return scipy.linalg.eigh(H, driver='evd')
+
+
+def _solve_lambda_newton(g_hat, Lambda, M, kappa_easy, lambduh, s_hat, maxiter):
+    """
+    Run the Newton iterations on lambda of the trust-region subproblem in the eigenbasis of H = U diag(Lambda) U^T,
+    where every step only involves n-vectors
+    :param g_hat: U^T g, the gradient in the eigenbasis of H
+    :param Lambda: Eigenvalues of H
+    :param M: Current value used for M in cubic upper approximation to f at x_new
+    :param kappa_easy: Convergence tolerance
+    :param lambduh: Starting value of lambda
+    :param s_hat: Starting value of -(H+lambda I)^(-1)g in the eigenbasis of H
+    :param maxiter: Maximum number of Newton iterations
+    :return: s_hat: U^T s, the step in the eigenbasis of H
+    :return: flag: 1 if H+lambda I is not positive definite for some iterate, 0 otherwise
+    """
+    sTs = s_hat.dot(s_hat)
+    iter = 0
+    while abs(math.sqrt(sTs)-2*lambduh/M) > kappa_easy and iter < maxiter:
+        iter += 1
+        norm_s = math.sqrt(sTs)
+        phi = 1/norm_s-M/(2*lambduh)
+        # s^T (H+lambda I)^(-1) s
+        w_sq = np.dot(s_hat*s_hat, 1/(Lambda+lambduh))
+        phi_prime = w_sq/(norm_s**3)+M/(2*lambduh**2)
+        lambduh -= phi/phi_prime
+        # Lambda is in ascending order, H+lambda I is positive definite iff its smallest eigenvalue is positive
+        if not Lambda[0]+lambduh > 0:
+            return np.zeros_like(g_hat), 1
+        s_hat = -g_hat/(Lambda+lambduh)
+        sTs = s_hat.dot(s_hat)
+    return s_hat, 0
+
+
+def _solve_lambda_newton_small(g_hat, Lambda, M, kappa_easy, lambduh, s_hat, maxiter):
+    """
+    Same as _solve_lambda_newton, with the n-vectors as lists of floats. For n up to SCALAR_MAX_DIM, numpy calls on
+    n-vectors are dominated by their overhead and the loop is faster in plain Python arithmetic.
+    """
+    g_hat, Lambda, s_hat = g_hat.tolist(), Lambda.tolist(), s_hat.tolist()
+    M, lambduh = float(M), float(lambduh)
+    sTs = sum([s*s for s in s_hat])
+    iter = 0
+    while abs(math.sqrt(sTs)-2*lambduh/M) > kappa_easy and iter < maxiter:
+        iter += 1
+        norm_s = math.sqrt(sTs)
+        phi = 1/norm_s-M/(2*lambduh)
+        w_sq = sum([s*s/(l+lambduh) for s, l in zip(s_hat, Lambda)])
+        phi_prime = w_sq/(norm_s**3)+M/(2*lambduh**2)
+        lambduh -= phi/phi_prime
+        if not Lambda[0]+lambduh > 0:
+            return np.zeros(len(g_hat)), 1
+        s_hat = [-g/(l+lambduh) for g, l in zip(g_hat, Lambda)]
+        sTs = sum([s*s for s in s_hat])
+    return np.array(s_hat), 0
+
+
+def _solve_monotone_norm(eta, eigvals, M, x, tol, maxiter):
+    """
+    Find the root of phi(x) = ||eta/(eigvals+3Mx)|| - x with Newton's method. On x > -min(eigvals)/(3M), phi is
+    convex and decreasing, so after the first step the iterates increase monotonically to the root.
+    :param eta: Gradient in the eigenbasis of the hessian
+    :param eigvals: Eigenvalues of the hessian, positive
+    :param M: Current value used for M in cubic upper approximation to f at x_new
+    :param x: Initial guess
+    :param tol: Tolerance on the length of the last Newton step
+    :param maxiter: Maximum number of Newton iterations
+    :return: x: Root of phi
+    :return: iter: Number of Newton iterations
+    """
+    eta_sq = eta*eta
+    for iter in range(1, maxiter+1):
+        d = eigvals+3*M*x
+        w = eta_sq/(d*d)
+        norm = math.sqrt(w.sum())
+        # phi'(x) = -3M sum(eta_i^2/d_i^3)/||eta/d|| - 1
+        step = (norm-x)/(-3*M*np.dot(w, 1/d)/norm-1)
+        x -= step
+        if abs(step) <= tol:
+            return x, iter
+    raise RuntimeError("Failed to converge after %d iterations, value is %s" % (maxiter, x))
+
+
+def _cross(u, v):
+    """
+    Cross product of two vectors of length 3
+    """
+    return (u[1]*v[2]-u[2]*v[1], u[2]*v[0]-u[0]*v[2], u[0]*v[1]-u[1]*v[0])
 
 
 class Algorithm:
     def __init__(self, x0, f=None, gradient=None, hessian=None, L=None, L0=None, kappa_easy=0.0001, maxiter=10000,
-                 submaxiter=100000, conv_tol=1e-5, conv_criterion='gradient', epsilon=2*np.sqrt(np.finfo(float).eps), aux_method="trust_region", verbose = 0):
+                 submaxiter=100000, conv_tol=1e-5, conv_criterion='gradient', epsilon=2*np.sqrt(np.finfo(float).eps), aux_method="trust_region", verbose = 0,
+                 vectorized=False, grad_x0=None, hess_x0=None):
         """
         Collect all the inputs to the cubic regularization algorithm.
         Required inputs: function to be solved.
@@ -41,10 +226,15 @@ class Algorithm:
         :param epsilon: Value added/subtracted from x when approximating gradients and Hessians
         :param aux_method: Method for solving the auxiliary problem
         :param verbose: Display of additional solving information
+        :param vectorized: Whether f accepts several points stacked along its first axis and returns their values,
+                           the gradient approximation then evaluates f once on all perturbed points
+        :param grad_x0: Gradient at x0 if already known, evaluated otherwise
+        :param hess_x0: Hessian at x0 if already known, evaluated otherwise
         """
-        self.f = f
-        self.gradient = gradient
-        self.hessian = hessian
+        # The same points are evaluated repeatedly, e.g. approx_hess evaluates the gradient at x again
+        self.f = _HashCache(f) if f is not None else None
+        self.gradient = _HashCache(gradient) if gradient is not None else None
+        self.hessian = _HashCache(hessian) if hessian is not None else None
         self.x0 = np.array(x0)*1.0
         self.maxiter = maxiter
         self.submaxiter = submaxiter
@@ -54,21 +244,29 @@ class Algorithm:
         self.L0 = L0
         self.kappa_easy = kappa_easy
         self.n = len(x0)
+        # Perturbations used by the finite difference approximations, row i is epsilon times the i'th basis vector
+        self._eps_basis = self.epsilon*np.identity(self.n)
 
         self.aux_method = aux_method
         self.verbose = verbose
+        self.vectorized = vectorized
 
         self._check_inputs()
+        # Convergence test of the chosen criterion, bound once instead of dispatching on its name every iteration
+        self._check_convergence = {'function': self._conv_function, 'gradient': self._conv_gradient,
+                                   'decrement': self._conv_decrement}[self.conv_criterion]
         # Estimate the gradient, hessian, and find a lower bound L0 for L if necessary
         if gradient is None:
-            self.gradient = self.approx_grad
+            self.gradient = _HashCache(self.approx_grad)
         if hessian is None:
-            self.hessian = self.approx_hess
+            self.hessian = _HashCache(self.approx_hess)
         if L0 is None and L is None:
             self.L0 = np.linalg.norm(self.hessian(self.x0)-self.hessian(self.x0+np.ones_like(self.x0)), ord=2)/np.linalg.norm(np.ones_like(self.x0))+self.epsilon
 
-        self.grad_x = self.gradient(self.x0)
-        self.hess_x = self.hessian(self.x0)
+        self.grad_x = self.gradient(self.x0) if grad_x0 is None else grad_x0
+        self.hess_x = self.hessian(self.x0) if hess_x0 is None else hess_x0
+        # Eigendecomposition of the Hessian at the current point, shared by lambda_nplus and the subproblems
+        self.hess_eigh = _eigh(self.hess_x)
         self.lambda_nplus = self._compute_lambda_nplus()[0]
 
     def _check_inputs(self):
@@ -105,26 +303,20 @@ class Algorithm:
         if not (self.aux_method == "trust_region" or self.aux_method == "monotone_norm"):
             raise ValueError("No such method for solving the auxiliary problem")
 
-    @staticmethod
-    def _std_basis(size, idx):
-        """
-        Compute the idx'th standard basis vector
-        :param size: Length of the vector
-        :param idx: Index of value 1 in the vector
-        :return: ei: Standard basis vector with 1 in the idx'th position
-        """
-        ei = np.zeros(size)
-        ei[idx] = 1
-        return ei
-
     def approx_grad(self, x):
         """
         Approximate the gradient of the function self.f at x
         :param x: Point at which the gradient will be approximated
         :return: Estimated gradient at x
         """
-        return np.asarray([(self.f(x + self.epsilon * self._std_basis(self.n, i)) -
-                            self.f(x - self.epsilon * self._std_basis(self.n, i))) / (2 * self.epsilon) for i in range(0, self.n)])
+        if self.vectorized:
+            # Column i is x+epsilon*e_i, column n+i is x-epsilon*e_i
+            x = np.asarray(x, dtype=float)[:, np.newaxis]
+            f_pm = self.f(np.concatenate((x + self._eps_basis, x - self._eps_basis), axis=1))
+            return (f_pm[:self.n] - f_pm[self.n:]) / (2 * self.epsilon)
+        f_plus = np.fromiter((self.f(x + e) for e in self._eps_basis), dtype=float, count=self.n)
+        f_minus = np.fromiter((self.f(x - e) for e in self._eps_basis), dtype=float, count=self.n)
+        return (f_plus - f_minus) / (2 * self.epsilon)
 
     def approx_hess(self, x):
         """
@@ -133,64 +325,83 @@ class Algorithm:
         :return: Estimated Hessian at x
         """
         grad_x0 = self.gradient(x)
-        hessian = np.zeros((self.n, self.n))
+        hessian = np.empty((self.n, self.n))
         for j in range(0, self.n):
-            grad_x_plus_eps = self.gradient(x + self.epsilon * self._std_basis(self.n, j))
-            for i in range(0, self.n):
-                hessian[i, j] = (grad_x_plus_eps[i]-grad_x0[i])/self.epsilon
-        return hessian
+            hessian[:, j] = (self.gradient(x + self._eps_basis[j])-grad_x0)/self.epsilon
+        # The Hessian is symmetric, averaging with the transpose also reduces the approximation error
+        return 0.5*(hessian+hessian.T)
 
     def _compute_lambda_nplus(self):
         """
-        Compute max(-1*smallest eigenvalue of hessian of f at x, 0)
+        Compute max(-1*smallest eigenvalue of hessian of f at x, 0) from the eigendecomposition self.hess_eigh
         :return: max(-1*smallest eigenvalue of hessian of f at x, 0)
         :return: lambda_n: Smallest eigenvaleu of hessian of f at x
         """
-        lambda_n = scipy.linalg.eigh(self.hess_x, eigvals_only=True, eigvals=(0, 0))
+        # The eigenvalues are in ascending order
+        lambda_n = self.hess_eigh[0][:1]
         return max(-lambda_n[0], 0), lambda_n
 
-    def _check_convergence(self, x_old, x_new):
+    def _conv_function(self, f_x_old, f_x_new):
         """
-        Check whether the cubic regularization algorithm has converged
-        :param lambda_min: Minimum eigenvalue at current point
-        :param M: Current value used for M in cubic upper approximation to f at x_new
+        Check whether the value of f stopped decreasing
+        :param f_x_old: Value of f at the previous point
+        :param f_x_new: Value of f at the current point
         :return: True/False depending on whether the convergence criterion has been satisfied
         """
-        if self.conv_criterion == 'function':
-            if self.f(x_new) > self.f(x_old):
-                return True
-            else:
-                return False
-        elif self.conv_criterion == 'gradient':
-            if np.linalg.norm(self.grad_x) <= self.conv_tol:
-                return True
-            else:
-                return False
-        elif self.conv_criterion == 'decrement':
-            lambda_sq = np.matmul(np.matmul(self.grad_x.T, np.linalg.pinv(self.hess_x)), self.grad_x)
-            if lambda_sq * 1/2 <= self.conv_tol:
-                return True
-            else:
-                return False
+        return bool(f_x_new > f_x_old)
+
+    def _conv_gradient(self, f_x_old, f_x_new):
+        """
+        Check whether the norm of the gradient is below the tolerance, compared squared to avoid the square root
+        :param f_x_old: Value of f at the previous point
+        :param f_x_new: Value of f at the current point
+        :return: True/False depending on whether the convergence criterion has been satisfied
+        """
+        return bool(np.dot(self.grad_x, self.grad_x) <= self.conv_tol*self.conv_tol)
+
+    def _conv_decrement(self, f_x_old, f_x_new):
+        """
+        Check whether half the squared Newton decrement g^T H^(-1) g is below the tolerance
+        :param f_x_old: Value of f at the previous point
+        :param f_x_new: Value of f at the current point
+        :return: True/False depending on whether the convergence criterion has been satisfied
+        """
+        try:
+            # With H = LL^T, g^T H^(-1) g = ||L^(-1) g||^2, a single triangular solve with the lower factor.
+            # H is symmetric, so its transpose is the same matrix in Fortran order, which LAPACK copies without
+            # transposing. The Hessian may be cached and shared, so it is not factorized in place.
+            c, lower = scipy.linalg.cho_factor(self.hess_x.T, lower=True)
+            w = scipy.linalg.solve_triangular(c, self.grad_x, lower=lower)
+            lambda_sq = w.dot(w)
+        except np.linalg.LinAlgError:
+            # Hessian not positive definite, g^T H^+ g in the eigenbasis of H with the cutoff of np.linalg.pinv
+            Lambda, U = self.hess_eigh
+            g_hat = U.T.dot(self.grad_x)
+            nonzero = np.abs(Lambda) > 1e-15*np.max(np.abs(Lambda))
+            lambda_sq = np.dot(g_hat[nonzero]**2, 1/Lambda[nonzero])
+        return bool(lambda_sq * 1/2 <= self.conv_tol)
 
 
 class CubicRegularization(Algorithm):
     def __init__(self, x0, f=None, gradient=None, hessian=None, L=None, L0=None, kappa_easy=0.0001, maxiter=10000,
-                 submaxiter=10000, conv_tol=1e-5, conv_criterion='gradient', epsilon=2*np.sqrt(np.finfo(float).eps), aux_method="trust_region", verbose=0):
+                 submaxiter=10000, conv_tol=1e-5, conv_criterion='gradient', epsilon=2*np.sqrt(np.finfo(float).eps), aux_method="trust_region", verbose=0,
+                 vectorized=False, grad_x0=None, hess_x0=None):
         Algorithm.__init__(self, x0, f=f, gradient=gradient, hessian=hessian, L=L, L0=L0, kappa_easy=kappa_easy,
                            maxiter=maxiter, submaxiter=submaxiter, conv_tol=conv_tol, conv_criterion=conv_criterion,
-                           epsilon=epsilon, aux_method=aux_method, verbose=verbose)
-
-        self.f_cubic = lambda x, y, mu: self.f(x) + np.matmul(self.grad_x.T,(y-x)) + 0.5*np.matmul((np.matmul(self.hess_x,(y-x))).T,(y-x)) + mu/6*(np.linalg.norm(y-x)**3)
+                           epsilon=epsilon, aux_method=aux_method, verbose=verbose, vectorized=vectorized,
+                           grad_x0=grad_x0, hess_x0=hess_x0)
 
     def _cubic_approx(self, f_x, s, mk):
         """
         Compute the value of the cubic approximation to f at the proposed next point
         :param f_x: Value of f(x) at current point x
         :param s: Proposed step to take
+        :param mk: Current value of M_k
         :return: Value of the cubic approximation to f at the proposed next point
         """
-        return f_x + np.matmul(self.grad_x.T,s) + 0.5*np.matmul((np.matmul(self.hess_x,s)).T,s) + mk/6*(np.linalg.norm(s)**3)
+        # ||s||^3 is computed from s^Ts, which avoids a second pass over s
+        sTs = s.dot(s)
+        return f_x + self.grad_x.dot(s) + 0.5*self.hess_x.dot(s).dot(s) + mk/6*sTs*np.sqrt(sTs)
 
     def cubic_reg(self):
         """
@@ -198,46 +409,51 @@ class CubicRegularization(Algorithm):
         :return: x_new: Final point
         :return: intermediate_points: All points visited by the cubic regularization algorithm on the way to x_new
         :return: iter: Number of iterations of cubic regularization
+        :return: flag: 0 if the subproblems were solved, 1 if the last one failed
+        :return: intermediate_hess_cond: Hessian condition number of each subproblem, -1 if not computed
         """
         iter = flag = 0
         converged = False
         x_new = self.x0
         mk = self.L0
-        intermediate_points = [x_new]
-        intermediate_hess_cond = []
-        MK = []
+        # Row k holds the k'th point, entry k the condition number of the k'th subproblem.
+        # Both arrays double in size when full rather than being allocated for maxiter iterations up front.
+        intermediate_points = np.empty((min(self.maxiter, 63)+1, self.n))
+        intermediate_points[0] = x_new
+        intermediate_hess_cond = np.empty(intermediate_points.shape[0]-1)
+        self.f_x = self.f(x_new)
         while iter < self.maxiter and converged is False:
+            if iter+1 == intermediate_points.shape[0]:
+                intermediate_points = np.resize(intermediate_points, (min(2*iter, self.maxiter)+1, self.n))
+                intermediate_hess_cond = np.resize(intermediate_hess_cond, intermediate_points.shape[0]-1)
             x_old = x_new.copy()
-            x_new, mk, flag, hess_cond = self._find_x_new(x_old, mk, iter)
-            MK.append(np.linalg.norm(self.grad_x))#np.linalg.norm(x_old-x_new))
+            f_x_old = self.f_x
+            x_new, self.f_x, mk, flag, hess_cond = self._find_x_new(x_old, f_x_old, mk, iter)
             self.grad_x = self.gradient(x_new)
             self.hess_x = self.hessian(x_new)
-            intermediate_hess_cond.append(hess_cond)
+            self.hess_eigh = _eigh(self.hess_x)
+            intermediate_hess_cond[iter] = hess_cond
             self.lambda_nplus, lambda_min = self._compute_lambda_nplus()
-            self.f_x = self.f(x_new)
-            converged = self._check_convergence(x_old, x_new)
+            converged = self._check_convergence(f_x_old, self.f_x)
             if flag != 0:
                 print(RuntimeWarning('Convergence criteria not met, likely due to round-off error or ill-conditioned '
                                      'Hessian.'))
-                return x_new, intermediate_points, iter, flag, intermediate_hess_cond
-            intermediate_points.append(x_new)
+                return x_new, intermediate_points[:iter+1], iter, flag, intermediate_hess_cond[:iter+1]
+            intermediate_points[iter+1] = x_new
             iter += 1
-        eigvals, eigvecs = scipy.linalg.eigh(self.hess_x)
-        if not (np.all(eigvals>=0)):
+        # lambda_nplus > 0 iff the Hessian at the last point has a negative eigenvalue
+        if self.lambda_nplus > 0:
             print(RuntimeWarning('Did not converge to a local minimum, likely a saddle point or gradient very small.'))
-        #print("avg(MK) =", "{:e}".format(np.average(MK)))
-        #x_mk = np.arange(0, iter)
-        #plt.plot(x_mk, MK)
-        #plt.yscale("log")
-        #plt.show()
-        return x_new, intermediate_points, iter, flag, intermediate_hess_cond
-
-    def _find_x_new(self, x_old, mk, iter):
+        return x_new, intermediate_points[:iter+1], iter, flag, intermediate_hess_cond[:iter]
+
+    def _find_x_new(self, x_old, f_x_old, mk, iter):
         """
         Determine what M_k should be and compute the next point for the cubic regularization algorithm
         :param x_old: Previous point
+        :param f_x_old: Value of f at the previous point
         :param mk: Previous value of M_k (will start with this if L isn't specified)
         :return: x_new: New point
+        :return: f_x_new: Value of f at the new point
         :return: mk: New value of M_k
         """
         upper_approximation = False
@@ -248,16 +464,18 @@ class CubicRegularization(Algorithm):
             if iter != 0:
                 mk *= 2
             #print("mk: ", mk, ", iter: ", iter)
+            # Only M changes between the subproblems, they share the eigendecomposition of the Hessian
             aux_problem = _AuxiliaryProblem(x_old, self.grad_x, self.hess_x, mk, self.lambda_nplus, self.kappa_easy,
-                                            self.submaxiter, self.aux_method, self.verbose)
+                                            self.submaxiter, self.aux_method, self.verbose, hess_eigh=self.hess_eigh)
             s, flag, hess_cond = aux_problem.solve()
             x_new = x_old + s
-            cubic_approx = self._cubic_approx(self.f(x_old), s, mk)
-            upper_approximation = (cubic_approx >= self.f(x_new))
+            f_x_new = self.f(x_new)
+            cubic_approx = self._cubic_approx(f_x_old, s, mk)
+            upper_approximation = (cubic_approx >= f_x_new)
             iter += 1
             if iter == self.submaxiter:
                 raise RuntimeError('Could not find cubic upper approximation')
-        return x_new, mk, flag, hess_cond
+        return x_new, f_x_new, mk, flag, hess_cond
 
 
 class _AuxiliaryProblem:
@@ -265,7 +483,8 @@ class _AuxiliaryProblem:
     Solve the cubic subproblem as described in Conn et. al (2000) (see reference at top of file)
     The notation in this function follows that of the above reference.
     """
-    def __init__(self, x, gradient, hessian, M, lambda_nplus, kappa_easy, submaxiter, aux_method, verbose):
+    def __init__(self, x, gradient, hessian, M, lambda_nplus, kappa_easy, submaxiter, aux_method, verbose,
+                 hess_eigh=None):
         """
         :param x: Current location of cubic regularization algorithm
         :param gradient: Gradient at current point
@@ -274,6 +493,7 @@ class _AuxiliaryProblem:
         :param lambda_nplus: max(-1*smallest eigenvalue of hessian of f at x, 0)
         :param kappa_easy: Convergence tolerance
         :param aux_method: Method to be used to solve the auxiliary problem
+        :param hess_eigh: Eigenvalues and eigenvectors of the hessian as returned by _eigh, computed if not given
         """
         self.x = x
         self.grad_x = gradient
@@ -284,52 +504,19 @@ class _AuxiliaryProblem:
         self.maxiter = submaxiter
         self.method = aux_method
         self.verbose = verbose
+        self.hess_eigh = hess_eigh
 
     def _compute_s(self, lambduh):
         """
-        Compute L in H_lambda = LL^T and then solve LL^Ts = -g
+        Solve (H+lambda I)s = -g in the eigenbasis of H = U diag(Lambda) U^T
         :param lambduh: value for lambda in H_lambda
-        :return: s, L
-        """
-        try:
-            # Numpy's Cholesky seems more numerically stable than scipy's Cholesky
-            L = np.linalg.cholesky(self.H_lambda(lambduh)).T
-        except:
-            # See p. 516 of Gould et al. (1999) (see reference at top of file)
-            self.lambda_const *= 2
-            try:
-                s, L = self._compute_s(self.lambda_nplus + self.lambda_const)
-            except:
-                return np.zeros_like(self.grad_x), [], 1
-        s = scipy.linalg.cho_solve((L, False), -self.grad_x)
-        return s, L, 0
-
-    def _update_lambda(self, lambduh, s, L):
+        :return: s_hat: U^T s, the step in the eigenbasis of H
+        :return: flag: 1 if H+lambda I is not positive definite, 0 otherwise
         """
-        Update lambda by taking a Newton step
-        :param lambduh: Current value of lambda
-        :param s: Current value of -(H+lambda I)^(-1)g
-        :param L: Matrix L from Cholesky factorization of H_lambda
-        :return: lambduh - phi/phi_prime: Next value of lambda
-        """
-        w = scipy.linalg.solve_triangular(L.T, s, lower=True)
-        norm_s = np.linalg.norm(s)
-        phi = 1/norm_s-self.M/(2*lambduh)
-        phi_prime = np.linalg.norm(w)**2/(norm_s**3)+self.M/(2*lambduh**2)
-        return lambduh - phi/phi_prime
-
-    def _converged(self, s, lambduh):
-        """
-        Check whether the algorithm from the subproblem has converged
-        :param s: Current estimate of -(H+ lambda I)^(-1)g
-        :param lambduh: Current estimate of lambda := Mr/2
-        :return: True/False based on whether the convergence criterion has been met
-        """
-        r = 2*lambduh/self.M
-        if abs(np.linalg.norm(s)-r) <= self.kappa_easy:
-            return True
-        else:
-            return False
+        Lambda_shifted = self.Lambda + lambduh
+        if not np.all(Lambda_shifted > 0):
+            return np.zeros_like(self.g_hat), 1
+        return -self.g_hat/Lambda_shifted, 0
 
     def solve(self):
         """
@@ -342,46 +529,59 @@ class _AuxiliaryProblem:
             """
             # Hessian condition number not calculated
             hess_cond = -1
-            # Function to compute H(x)+lambda*I as function of lambda
-            self.H_lambda = lambda lambduh: self.hess_x + lambduh*np.identity(np.size(self.hess_x, 0))
+            # Diagonalize the Hessian once, every H+lambda*I below shares its eigenvectors U
+            # and only needs the eigenvalues Lambda shifted by lambda
+            if self.hess_eigh is None:
+                self.hess_eigh = _eigh(self.hess_x)
+            self.Lambda, U = self.hess_eigh
+            self.g_hat = U.T.dot(self.grad_x)
             # Constant to add to lambda_nplus so that you're not at the zero where the eigenvalue is
             self.lambda_const = (1+self.lambda_nplus)*np.sqrt(np.finfo(float).eps)
             if self.lambda_nplus == 0:
                 lambduh = 0
             else:
                 lambduh = self.lambda_nplus + self.lambda_const
-            s, L, flag = self._compute_s(lambduh)
+            s_hat, flag = self._compute_s(lambduh)
             if flag != 0:
-                return s, flag, hess_cond
+                return np.zeros_like(self.grad_x), flag, hess_cond
             r = 2*lambduh/self.M
-            if np.linalg.norm(s) <= r:
-                if lambduh == 0 or np.linalg.norm(s) == r:
-                    return s, 0, hess_cond
+            if np.linalg.norm(s_hat) <= r:
+                if lambduh == 0 or np.linalg.norm(s_hat) == r:
+                    return U.dot(s_hat), 0, hess_cond
                 else:
-                    Lambda, U = np.linalg.eigh(self.H_lambda(self.lambda_nplus))
-                    s_cri = -U.dot(np.linalg.pinv(np.diag(Lambda))).dot(U.T).dot(self.grad_x)
-                    alpha = max(np.roots([np.dot(U[:, 0], U[:, 0]),
-                                        2*np.dot(U[:, 0], s_cri), np.dot(s_cri, s_cri)-4*self.lambda_nplus**2/self.M**2]))
+                    # Eigenvalues of H + lambda_nplus*I
+                    Lambda = self.Lambda + self.lambda_nplus
+                    # Pseudo-inverse of the diagonal, eigenvalues below the cutoff of np.linalg.pinv are dropped
+                    Lambda_inv = np.zeros_like(Lambda)
+                    nonzero = np.abs(Lambda) > 1e-15*np.max(np.abs(Lambda))
+                    Lambda_inv[nonzero] = 1/Lambda[nonzero]
+                    s_cri = -U.dot(Lambda_inv*U.T.dot(self.grad_x))
+                    # Largest root of a*alpha^2 + b*alpha + c = 0, with the numerically stable quadratic formula
+                    a = np.dot(U[:, 0], U[:, 0])
+                    b = 2*np.dot(U[:, 0], s_cri)
+                    c = np.dot(s_cri, s_cri)-4*self.lambda_nplus**2/self.M**2
+                    q = -0.5*(b+np.copysign(np.sqrt(max(b*b-4*a*c, 0)), b))
+                    alpha = max(q/a, c/q) if q != 0 else 0
                     s = s_cri + alpha*U[:, 0]
                     return s, 0, hess_cond
             if lambduh == 0:
                 lambduh += self.lambda_const
-            iter = 0
-            while not self._converged(s, lambduh) and iter < self.maxiter:
-                iter += 1
-                lambduh = self._update_lambda(lambduh, s, L)
-                s, L, flag = self._compute_s(lambduh)
-                if flag != 0:
-                    return s, flag, hess_cond
-                #if iter == self.maxiter:
-                #    print(RuntimeWarning('Warning: Could not compute s: maximum number of iterations reached'))
+            # The Newton iterations on lambda only involve the n eigenvalues, the norm of s is the norm of s_hat
+            solve_lambda_newton = _solve_lambda_newton_small if len(s_hat) <= SCALAR_MAX_DIM else _solve_lambda_newton
+            s_hat, flag = solve_lambda_newton(self.g_hat, self.Lambda, self.M, self.kappa_easy, lambduh, s_hat,
+                                              self.maxiter)
+            if flag != 0:
+                return np.zeros_like(self.grad_x), flag, hess_cond
+            s = U.dot(s_hat)
         elif self.method == "monotone_norm":
             """
             Newton on a monotone function.
             """
             # Compute the eigenvalues and the eigenvectors of the Hessian
             try:
-                eigvals, eigvecs = scipy.linalg.eigh(self.hess_x)
+                if self.hess_eigh is None:
+                    self.hess_eigh = _eigh(self.hess_x)
+                eigvals, eigvecs = self.hess_eigh
                 eigvals_min = eigvals[0]
                 eigvals = np.where(eigvals<=0, 1.0e-08, eigvals)
                 # Calculating hessian condition number for plotting
@@ -389,43 +589,25 @@ class _AuxiliaryProblem:
                 #print("Eigenvalues :", eigvals)
             except:
                 raise RuntimeError("Failed to compute the eigenvalues of the hessian")
-            # Diagonalize the Hessian
-            try:
-                O = np.column_stack(eigvecs)
-                I = np.matmul(O.T,O)
-                I[np.isclose(I, 0)] = 0
-            except:
-                raise RuntimeError("Failed to diagonalize the hessian")
-            # Diagonalization check
-            assert (I.shape[0] == I.shape[1]) and np.allclose(I, np.eye(I.shape[0]))
+            # Diagonalization check, eigh already returns orthonormal eigenvectors so it only runs when debugging
+            if __debug__ and self.verbose:
+                assert np.allclose(eigvecs.T.dot(eigvecs), np.eye(eigvecs.shape[0]))
 
-            # Solve the auxiliary one-dimensional problem
-            eta = np.matmul(O,self.grad_x)
+            # Solve the auxiliary one-dimensional problem in the eigenbasis of the Hessian
+            eta = eigvecs.T.dot(self.grad_x)
             # If not at a stationary point, solve the auxiliary problem
             if not np.all(np.isclose(eta, 0)):
-                # Monotone function to solve.
                 #print("eigvals:", eigvals, ", M:", self.M)
-                f = lambda x, et, l, mu: np.linalg.norm(et/(l+3*mu*x))-x
-                #fder = lambda x, et, l, mu: np.sum((-3*mu*np.sqrt((et*et)/((l+3*mu*x)*(l+3*mu*x))))/(l+3*mu*x))-1
                 # Initial guess for Newton's method.
                 x0 = max((-1*np.min(eigvals))/(3*self.M)+1.0e-04,1.0e-04)
-                (v, r) = newton(f, x0, args=(eta, eigvals, self.M), maxiter=self.maxiter, full_output=True, tol=1.48e-8)
-                """
-                print("Newton root :", r.root)
-                print("Newton func value :", f(r.root, eta, eigvals, self.M))
-                T = np.arange(0,0.2,0.001)
-                f_T = [f(t, eta, eigvals, self.M) for t in T]
-                plt.plot(T, f_T)
-                plt.scatter(r.root, f(r.root, eta, eigvals, self.M))
-                plt.show()
-                """
+                # Newton's method on the monotone function ||eta/(eigvals+3Mx)|| - x
+                v, newton_iter = _solve_monotone_norm(eta, eigvals, self.M, x0, 1.48e-8, self.maxiter)
                 if self.verbose == 1:
-                    print("Newton root :", r.root)
-                    print("Newton iterations :", r.iterations)
-                    print("Newton function calls :", r.function_calls)
+                    print("Newton root :", v)
+                    print("Newton iterations :", newton_iter)
                 u = -eta/(eigvals+3*self.M*v)
                 # Compute the step size.
-                s = np.matmul(O.T, u)
+                s = eigvecs.dot(u)
             # Classify the stationary point w.r.t. second order optimality condition.
             else:
                 # Maximum or saddle point, move to the descent direction
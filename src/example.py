@@ -1,21 +1,30 @@
 import src.cubic_reg as cubic_reg
-import matplotlib.pyplot as plt
 import numpy as np
 from scipy.optimize import rosen as banana_f
 from scipy.optimize import rosen_der as banana_grad
 from scipy.optimize import rosen_hess as banana_hess
 
+# Parameters of the Ackley function, a + e is its constant term
+ACKLEY_A = 20.
+ACKLEY_B = 0.2
+ACKLEY_C = 2*np.pi
+ACKLEY_A_PLUS_E = ACKLEY_A + np.e
+
 def Ackley(x):
     """
     Ackley function, description can be found here: https://en.wikipedia.org/wiki/Test_functions_for_optimization.
+    Several points can be evaluated at once by stacking them along the first axis.
     """
-    a = 20
-    b = 0.2
-    c = 2*np.pi
-    dim = len(x)
-    term1 = -1. * a * np.exp(-1. * b * np.sqrt((1./dim) * sum(map(lambda i: i**2, x))))
-    term2 = -1. * np.exp((1./dim) * (sum(map(lambda j: np.cos(c * j), x))))
-    return term1 + term2 + a + np.exp(1)
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    dim = x.shape[0]
+    # cos(c*x) computed in a single temporary array
+    cx = np.multiply(x, ACKLEY_C)
+    np.cos(cx, out=cx)
+    # Sum of squares over the first axis, a plain dot product for a single point
+    sum_sq = x.dot(x) if x.ndim == 1 else np.einsum('i...,i...->...', x, x)
+    term1 = -ACKLEY_A * np.exp(-ACKLEY_B * np.sqrt(sum_sq / dim))
+    term2 = -np.exp(cx.sum(axis=0) / dim)
+    return term1 + term2 + ACKLEY_A_PLUS_E
 
 class Function:
     """
@@ -23,12 +32,14 @@ class Function:
     """
     def __init__(self, function='bimodal', aux_method="trust_region"):
         self.plot_name = function
+        # Every f below also accepts points stacked along the first axis, so that plots evaluate the whole grid at once
         if function == 'bimodal':
-            self.f_sub = lambda x, i: x[i]**2*np.exp(1-np.linalg.norm(x)**2) 
-            self.f = lambda x: -(self.f_sub(x,0)+3*self.f_sub(x,1))
-            self.basis = lambda i: (np.arange(2) == i).astype(int)
-            self.grad_sub = lambda x, i: 2*np.exp(1-np.linalg.norm(x)**2)*(x[i]*self.basis(i)-x[i]**2*x)
-            self.grad = lambda x : -(self.grad_sub(x,0)+3*self.grad_sub(x,1))
+            # Standard basis vectors, built once instead of on every gradient call
+            self.basis = (np.array([1., 0.]), np.array([0., 1.]))
+            # Last point at which the bimodal function was evaluated, with its value and gradient
+            self._bimodal_last = (None, None)
+            self.f = lambda x: self._bimodal_fg(x)[0] if np.ndim(x) == 1 else -np.exp(1-x[0]**2-x[1]**2)*(x[0]**2+3*x[1]**2)
+            self.grad = lambda x: self._bimodal_fg(x)[1]
             self.hess = None
             self.x0 = np.array([1, 0])  # Start at saddle point!
             self.plot_x_lim = 1.2
@@ -69,10 +80,27 @@ class Function:
         elif function == 'polynomial':
             n = 2
             a = np.random.uniform(-1,1,size=(n,n))
-            A = (a + a.T)/2
+            A = np.ascontiguousarray((a + a.T)/2, dtype=np.float64)
             c = np.random.uniform(-10,10)
-            self.f = lambda x: (x[1]-x[0]*x[0])**2+(A[0,0]*x[0]*x[0]-c)**2+(A[0,1]*x[0]*x[1]-c)**2+(A[1,0]*x[1]*x[0]-c)**2+(A[1,1]*x[1]*x[1]-c)**2
-            self.grad = None
+            def f(x, A=A, c=c):
+                # Residuals A_ij*x_i*x_j - c computed in place, the trailing axes of A broadcast over stacked points
+                x = np.asarray(x, dtype=np.float64)
+                t = A.reshape(A.shape+(1,)*(x.ndim-1))*x[:, None]*x[None, :]
+                t -= c
+                return (x[1]-x[0]*x[0])**2+np.einsum('ij...,ij...->...', t, t)
+            def grad(x, A=A, c=c):
+                # Gradient of the residual sum of squares is 2*(R*A + (R*A)^T) x with R_ij = A_ij*x_i*x_j - c
+                t = A*np.multiply.outer(x, x)
+                t -= c
+                t *= A
+                g = 2*(t.dot(x)+t.T.dot(x))
+                # Chain term (x_1 - x_0^2)^2
+                d = x[1]-x[0]*x[0]
+                g[0] -= 4*x[0]*d
+                g[1] += 2*d
+                return g
+            self.f = f
+            self.grad = grad
             self.hess = None
             self.x0 = np.random.uniform(-10,10,(n,))
             self.plot_x_lim = 8
@@ -81,7 +109,28 @@ class Function:
         else:
             raise TypeError('Invalid input type for function initialization')
         self.cr = cubic_reg.CubicRegularization(self.x0, f=self.f, gradient=self.grad, hessian=self.hess, maxiter=10000, conv_tol=1e-8,
-                                                    L0=1.e-05, aux_method=aux_method, verbose=0, conv_criterion='gradient')
+                                                    L0=1.e-05, aux_method=aux_method, verbose=0, conv_criterion='gradient',
+                                                    vectorized=True)
+
+    def _bimodal_fg(self, x):
+        """
+        Compute the value and the gradient of the bimodal function, sharing exp(1-||x||^2) between the two.
+        Cubic regularization asks for f and its gradient at the same iterate, so the last result is kept
+        and reused when called again at the same point.
+        :param x: Point at which the function is evaluated
+        :return: f_x: Value of the bimodal function at x
+        :return: grad_x: Gradient of the bimodal function at x
+        """
+        x = np.asarray(x, dtype=float)
+        key = x.tobytes()
+        if key == self._bimodal_last[0]:
+            return self._bimodal_last[1]
+        q = np.exp(1-np.dot(x, x))
+        wx2 = x[0]**2+3*x[1]**2
+        f_x = -q*wx2
+        grad_x = -2*q*(x[0]*self.basis[0]+3*x[1]*self.basis[1]-wx2*x)
+        self._bimodal_last = (key, (f_x, grad_x))
+        return f_x, grad_x
 
     def run(self):
         """
@@ -96,16 +145,21 @@ class Function:
         Plot the intermediate steps of cubic regularization.
         :param intermediate_points: Intermediate points of cubic regularization minimization
         """
+        import matplotlib.pyplot as plt
         points = np.asarray(intermediate_points)
         xlist = np.linspace(-1*self.plot_x_lim, self.plot_x_lim, self.plot_nb_contours)
         ylist = np.linspace(-1*self.plot_y_lim, self.plot_y_lim, self.plot_nb_contours)
-        X, Y = np.meshgrid(xlist, ylist)
-        Z = np.zeros_like(X)
-        for i in range(0, len(X)):
-            for j in range(0, len(X)):
-                Z[i, j] = self.f((X[i, j], Y[i, j]))
+        # Grid points stacked along the first axis, so that f can evaluate all of them in one call
+        XY = np.stack(np.meshgrid(xlist, ylist), axis=0)
+        try:
+            Z = np.asarray(self.f(XY), dtype=float)
+            if Z.shape != XY.shape[1:]:
+                raise ValueError('f did not return one value per grid point')
+        except (TypeError, ValueError, IndexError):
+            # f only takes single points, evaluate it on every grid point
+            Z = np.vectorize(self.f, signature='(2)->()')(np.moveaxis(XY, 0, -1))
         plt.clf()
-        cs = plt.contour(X, Y, Z, self.plot_nb_contours, cmap=plt.cm.magma, alpha=0.8, extend='both')
+        cs = plt.contour(xlist, ylist, Z, self.plot_nb_contours, cmap=plt.cm.magma, alpha=0.8, extend='both')
         # Show contour values.
         #plt.clabel(cs, cs.levels, inline=True, fontsize=10)
         plt.scatter(points[0, 0], points[0, 1], marker='.', color='#495CD5')
@@ -1,6 +1,19 @@
 import numpy as np
 import src.cubic_reg as cubic_reg
-from matplotlib import pyplot as plt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+def _quadratic_obj(x, A, cn2, lambd):
+    """
+    Value of the n-dimensional quadratic objective at x, with the problem data passed explicitly.
+    :param x: point at which to evaluate the objective
+    :param A: symmetric matrix
+    :param cn2: scalar c multiplied by n^2 (the constant part of the double sum over A)
+    :param lambd: constraint coefficient
+    """
+    # Constraint term sum_i (x_i - x_{i-1}*x_0)^2 and the double sum over A, both vectorized.
+    term1 = np.sum(np.square(x[1:]-x[:-1]*x[0]))
+    term2 = x.dot(A).dot(x)-cn2
+    return lambd*term1+term2**2
 
 def quadratic_obj(n, A, c, lambd=1):
     """
@@ -10,17 +23,89 @@ def quadratic_obj(n, A, c, lambd=1):
     :param c: scalar
     """
     assert(n==A.shape[0])
-    def f(x):
-        term1 = 0
-        term2 = 0
-        for i in range(1,n):
-            term1 += (x[i]-x[i-1]*x[0])**2
-        for i in range(0,n):
-            for j in range(0,n):
-                term2 += (A[i,j]*x[i]*x[j]-c)
-        return lambd*term1+term2**2
+    A = np.ascontiguousarray(A, dtype=np.float64)
+    cn2 = c*n*n
+    def f(x, A=A, cn2=cn2, lambd=lambd):
+        return _quadratic_obj(np.asarray(x), A, cn2, lambd)
     return f
 
+def _quadratic_obj_grad(x, AAt, cn2, lambd):
+    """
+    Gradient of the n-dimensional quadratic objective at x.
+    :param x: point at which to evaluate the gradient
+    :param AAt: matrix A+A^T (the gradient of x^T A x is (A+A^T)x)
+    :param cn2: scalar c multiplied by n^2
+    :param lambd: constraint coefficient
+    """
+    # Constraint term, d_i = x_i - x_{i-1}*x_0 depends on x_i, x_{i-1} and x_0
+    d = x[1:]-x[:-1]*x[0]
+    grad1 = np.zeros(x.shape)
+    grad1[1:] += 2*d
+    grad1[:-1] -= 2*x[0]*d
+    grad1[0] -= 2*d.dot(x[:-1])
+    # Squared double sum term
+    AAtx = AAt.dot(x)
+    term2 = 0.5*x.dot(AAtx)-cn2
+    return lambd*grad1+2*term2*AAtx
+
+def _quadratic_obj_hess(x, AAt, cn2, lambd, idx, J, S):
+    """
+    Hessian of the n-dimensional quadratic objective at x.
+    :param x: point at which to evaluate the Hessian
+    :param AAt: matrix A+A^T
+    :param cn2: scalar c multiplied by n^2
+    :param lambd: constraint coefficient
+    :param idx: indices 0, ..., n-2
+    :param J: (n-1, n) work array, overwritten
+    :param S: (n, n) work array, overwritten
+    """
+    d = x[1:]-x[:-1]*x[0]
+    # Jacobian of d, row i-1 holds the derivatives of d_i w.r.t. x_i, x_{i-1} and x_0
+    J.fill(0)
+    J[idx, idx+1] = 1
+    J[idx, idx] -= x[0]
+    J[:, 0] -= x[:-1]
+    # Second derivatives of d_i are -1 at (0, i-1) and (i-1, 0), weighted by d_i
+    S.fill(0)
+    S[0, :-1] -= d
+    S[:-1, 0] -= d
+    # Squared double sum term
+    AAtx = AAt.dot(x)
+    term2 = 0.5*x.dot(AAtx)-cn2
+    return 2*lambd*(J.T.dot(J)+S)+2*np.outer(AAtx, AAtx)+2*term2*AAt
+
+def quadratic_obj_grad(n, A, c, lambd=1):
+    """
+    Gradient of the n-dimensional quadratic objective function.
+    :param n: dimension of the problem
+    :param A: symmetric matrix
+    :param c: scalar
+    """
+    assert(n==A.shape[0])
+    AAt = np.ascontiguousarray(A+A.T, dtype=np.float64)
+    cn2 = c*n*n
+    def grad(x, AAt=AAt, cn2=cn2, lambd=lambd):
+        return _quadratic_obj_grad(np.asarray(x, dtype=np.float64), AAt, cn2, lambd)
+    return grad
+
+def quadratic_obj_hess(n, A, c, lambd=1):
+    """
+    Hessian of the n-dimensional quadratic objective function.
+    :param n: dimension of the problem
+    :param A: symmetric matrix
+    :param c: scalar
+    """
+    assert(n==A.shape[0])
+    AAt = np.ascontiguousarray(A+A.T, dtype=np.float64)
+    cn2 = c*n*n
+    # The dimension is fixed, so the index array and the work arrays are allocated once for all calls
+    idx = np.arange(n-1)
+    J = np.empty((n-1, n))
+    S = np.empty((n, n))
+    def hess(x, AAt=AAt, cn2=cn2, lambd=lambd, idx=idx, J=J, S=S):
+        return _quadratic_obj_hess(np.asarray(x, dtype=np.float64), AAt, cn2, lambd, idx, J, S)
+    return hess
+
 def quadratic_obj_1D(n, A, c):
     """
     A one-dimensional quadratic objective function.
@@ -29,20 +114,37 @@ def quadratic_obj_1D(n, A, c):
     :param c: scalar
     """
     assert(n==A.shape[0])
+    A = np.ascontiguousarray(A, dtype=np.float64)
     def f_1D(x0):
         """
         A quadratic objective with quadratic constraints w.r.t. x[0]
         for testing the accuraccy of the n-dimensional solution.
         """
         x = np.power(np.ones(n)*x0, np.arange(1,n+1))
-        term2 = 0
-        for i in range(0,n):
-            for j in range(0,n):
-                term2 += (A[i,j]*x[i]*x[j]-c)
+        term2 = x.dot(A).dot(x)-c*n*n
         return term2**2
     return f_1D
 
-def test_quadratic_obj(n, A=None, c=None, lambd=1, nb_minima=1):
+def _find_minimum(n, A, c, x0):
+    """
+    Minimize the quadratic objective with cubic regularization from one initial point.
+    Defined at module level so that it can be sent to worker processes.
+    :param n: dimension of the problem
+    :param A: symmetric matrix
+    :param c: scalar
+    :param x0: initial point
+    :return: f_opt: objective value at the local minimum found
+    :return: x_opt: local minimum found
+    :return: n_iter: number of cubic regularization iterations
+    """
+    f = quadratic_obj(n, A, c, lambd = 1)
+    gradient = quadratic_obj_grad(n, A, c, lambd = 1)
+    hessian = quadratic_obj_hess(n, A, c, lambd = 1)
+    cr = cubic_reg.CubicRegularization(x0, f=f, gradient=gradient, hessian=hessian, conv_tol=1e-10, L0=1e-4, aux_method="monotone_norm", verbose=0, conv_criterion='gradient', maxiter=10000)
+    x_opt, intermediate_points, n_iter, flag, intermediate_hess_cond = cr.cubic_reg()
+    return f(x_opt), x_opt, n_iter
+
+def test_quadratic_obj(n, A=None, c=None, lambd=1, nb_minima=1, max_workers=None, seed=None, decimals=2, max_distinct=None):
     """
     Test cubic regularization on a quadratic usually non-convex objective
     with the global minimum at 0.
@@ -51,6 +153,10 @@ def test_quadratic_obj(n, A=None, c=None, lambd=1, nb_minima=1):
     :param c: scalar
     :param lambd: constraint coefficient
     :param nb_minima: number of times to run cubic reg. from diff. initial points
+    :param max_workers: number of processes running cubic reg. in parallel (all cores by default)
+    :param seed: seed for the initial points (drawn from the global numpy generator by default)
+    :param decimals: accuracy to which minima are rounded before counting the distinct ones
+    :param max_distinct: stop early once this many distinct minima have been found (never by default)
     """
     # Dimension of the problem.
     n = n
@@ -60,18 +166,31 @@ def test_quadratic_obj(n, A=None, c=None, lambd=1, nb_minima=1):
         A = (a + a.T)/2
         A[n-1, n-1] = 0
         c = np.random.uniform(-10,10)
-    f = quadratic_obj(n, A, c, lambd = 1)
-    # All local minima found from different initial points.
+    # All local minima found from different initial points, and which runs have finished.
     minima = np.zeros(nb_minima)
-    # Minimize f using cubic regularization.
-    for i in range(nb_minima):
-        x0 = np.random.uniform(-10,10,(n,))
-        cr = cubic_reg.CubicRegularization(x0, f=f, conv_tol=1e-10, L0=1e-4, aux_method="monotone_norm", verbose=0, conv_criterion='gradient', maxiter=10000)
-        x_opt, intermediate_points, n_iter, flag, intermediate_hess_cond = cr.cubic_reg()
-        minima[i] = f(x_opt)
-        print("Objective value:", minima[i], ", iterations:", n_iter, ", experiment:", i, "\nArgmin x*:", x_opt)
+    found = np.zeros(nb_minima, dtype=bool)
+    # Draw all initial points at once. By default the seed is taken from the global generator,
+    # so that np.random.seed still makes runs reproducible.
+    if seed is None:
+        seed = np.random.randint(0, 2**31-1)
+    rng = np.random.default_rng(seed)
+    X0 = rng.uniform(-10,10,(nb_minima,n))
+    # Minimize f using cubic regularization, the runs are independent and are dispatched to several processes.
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_find_minimum, n, A, c, x0): i for i, x0 in enumerate(X0)}
+        for future in as_completed(futures):
+            i = futures[future]
+            f_opt, x_opt, n_iter = future.result()
+            minima[i] = f_opt
+            found[i] = True
+            print("Objective value:", minima[i], ", iterations:", n_iter, ", experiment:", i, "\nArgmin x*:", x_opt)
+            # Minima equal up to the given accuracy are counted once.
+            if max_distinct is not None and len(np.unique(np.around(minima[found], decimals=decimals))) >= max_distinct:
+                for pending in futures:
+                    pending.cancel()
+                break
     # Round all minima to a specified accuracy.
-    minima = np.around(minima, decimals=2)
+    minima = np.around(minima[found], decimals=decimals)
     print("Number of local minima found:", len(np.unique(minima)), ", best local minimum:", np.min(minima))
 
 def plot_cond(intermediate_hess_cond, n_iter):
@@ -81,6 +200,7 @@ def plot_cond(intermediate_hess_cond, n_iter):
     :param intermediate_hess_cond: hessian condition number at each iteration
     :param n_iter: number of iterations
     """
+    from matplotlib import pyplot as plt
     k = min(n_iter, 1000)
     X = np.arange(0, k, 1)
     plt.figure()
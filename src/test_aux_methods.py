@@ -1,14 +1,76 @@
 import numpy as np
 import src.cubic_reg as cubic_reg
-import matplotlib.pyplot as plt
 from src.quadratic_obj import quadratic_obj
 import time
+import contextlib
+import io
+import csv
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product
 
-def test_aux_methods(nb_experiments=10, high_dim=9):
+# Methods for solving the auxiliary problem compared by the experiments
+AUX_METHODS = ("trust_region", "monotone_norm")
+
+# Experiments of the worker process, set by _init_worker
+_worker_problems = None
+
+def _init_worker(problems):
+    """
+    Store the experiments in a worker process and build the objective of every dimension once,
+    so that the runs in this process share it and the tasks only need to send their indices.
+    Then warm up the solver before any run is timed.
+    :param problems: dimension, matrix A, scalar c and initial points of every dimension
+    """
+    global _worker_problems
+    _worker_problems = [(quadratic_obj(n, A, c, lambd=1), X0) for n, A, c, X0 in problems]
+    # A few discarded iterations of both methods, so that one-time costs of the process (lazy imports,
+    # BLAS initialization) are not counted in the time of its first experiment
+    f = quadratic_obj(3, np.eye(3), 1.0, lambd=1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for aux_method in AUX_METHODS:
+            cubic_reg.CubicRegularization(np.ones(3), f=f, L0=1.e-05, aux_method=aux_method, maxiter=5).cubic_reg()
+
+def _run_one(f, x0, aux_method, grad_x0, hess_x0):
+    """
+    Minimize the quadratic objective with cubic regularization from one initial point.
+    :param f: quadratic objective
+    :param x0: initial point
+    :param aux_method: method for solving the auxiliary problem
+    :param grad_x0: gradient of the objective at x0
+    :param hess_x0: hessian of the objective at x0
+    :return: elapsed: time taken by the solver (s)
+    :return: success: whether the global minimum 0 was found
+    :return: n_iter: number of cubic regularization iterations
+    """
+    cr = cubic_reg.CubicRegularization(x0, f=f, conv_tol=1e-10, L0=1.e-05, aux_method=aux_method, verbose=0, conv_criterion='gradient',
+                                       grad_x0=grad_x0, hess_x0=hess_x0)
+    # Only the solver is timed, with a monotonic high resolution clock
+    start_time = time.perf_counter()
+    x_opt, intermediate_points, n_iter, flag, intermediate_hess_cond = cr.cubic_reg()
+    elapsed = time.perf_counter() - start_time
+    success = np.isclose(f(x_opt),0)
+    return elapsed, success, n_iter
+
+def _run_pair(i, j):
+    """
+    Run one experiment with every method of AUX_METHODS, from the same initial point.
+    :param i: index of the dimension of the problem
+    :param j: index of the experiment, i.e. of the initial point
+    :return: elapsed time, success and number of iterations of each method, as returned by _run_one
+    """
+    f, X0 = _worker_problems[i]
+    # Both methods start from the same gradient and hessian approximations at x0, computed once here
+    init = cubic_reg.CubicRegularization(X0[j], f=f, L0=1.e-05)
+    return tuple(_run_one(f, X0[j], aux_method, init.grad_x, init.hess_x) for aux_method in AUX_METHODS)
+
+def test_aux_methods(nb_experiments=10, high_dim=9, max_workers=None, seed=None, show=True):
     """
     Compare Trust region and Monotone norm methods for solving the auxiliary problem.
     :param nb_experiments: number of times both methods will be executed
     :param high_dim: highest dimension of the problem (will run all odd dimensions starting at 3)
+    :param max_workers: number of processes running the experiments in parallel (all cores by default)
+    :param seed: seed of the objective parameters and the initial points (drawn from the global numpy generator by default)
+    :param show: whether to display the figures, they are saved in 'figures' folder either way
     """
     # Specify number of experiments
     nb_experiments = nb_experiments
@@ -17,97 +79,129 @@ def test_aux_methods(nb_experiments=10, high_dim=9):
     nb_N = N.shape[0]
     # For collecting experiment data and plotting
     fig_name = "aux_methods"
-    time_tr = np.zeros((nb_N, nb_experiments))
-    time_mn = np.zeros((nb_N, nb_experiments))
-    glob_min_tr = np.zeros((nb_N, nb_experiments))
-    glob_min_mn = np.zeros((nb_N, nb_experiments))
-    iters_tr = np.zeros((nb_N, nb_experiments))
-    iters_mn = np.zeros((nb_N, nb_experiments))
-
-    # Solve for multiple increasing dimensions
-    for i in range(nb_N):
+    csv_path = "figures/"+fig_name+".csv"
+
+    # By default the seed is taken from the global generator, so that np.random.seed still makes runs reproducible.
+    if seed is None:
+        seed = np.random.randint(0, 2**31-1)
+    # Draw the parameters of the quadratic objective for every dimension and the initial points
+    # of every experiment up front, so that the random draws do not depend on the order the runs finish in.
+    # Each dimension has its own independent stream, so changing high_dim does not change the other draws.
+    rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(nb_N)]
+    problems = []
+    for i, rng in enumerate(rngs):
         # Dimension of the problem
         n = N[i]
         # Parameters for the quadratic objective
-        a = np.random.randint(-1,1,size=(n,n))
+        a = rng.integers(-1,1,size=(n,n))
         A = (a + a.T)/2
         A[n-1, n-1] = 0
-        c = np.random.uniform(-10,10)
-        # Generate the objective function
-        f = quadratic_obj(n, A, c, lambd=1)
-        # Number of experiments per dimension
-        for j in range(nb_experiments):
-            start_time = time.time()
-            # Initial point for cubic regularization
-            x0 = np.random.randint(-10,10,size=(n,))
-            cr = cubic_reg.CubicRegularization(x0, f=f, conv_tol=1e-10, L0=1.e-05, aux_method="trust_region", verbose=0, conv_criterion='gradient')
-            x_opt, intermediate_points, n_iter, flag, intermediate_hess_cond = cr.cubic_reg()
-            if np.isclose(f(x_opt),0):
-                iters_tr[i,j] = n_iter
-                time_tr[i,j] = time.time() - start_time
-                glob_min_tr[i,j] = 1
-            else:
-                iters_tr[i,j] = -1
-                time_tr[i,j] = -1
-                glob_min_tr[i,j] = 0
-            #print("Trust region\n", "Iterations:", n_iter, ", time:", time.time() - start_time, ", f_opt:", f(x_opt))
-            #print("Argmin of f: ", x_opt, ".\n")
-
-            start_time = time.time()
-            cr = cubic_reg.CubicRegularization(x0, f=f, conv_tol=1e-10, L0=1.e-05, aux_method="monotone_norm", verbose=0, conv_criterion='gradient')
-            x_opt, intermediate_points, n_iter, flag, intermediate_hess_cond = cr.cubic_reg()
-            if np.isclose(f(x_opt),0):
-                iters_mn[i,j] = n_iter
-                time_mn[i,j] = time.time() - start_time
-            else:
-                iters_mn[i,j] = -1
-                time_mn[i,j] = -1
-                glob_min_mn[i,j] = 0
-            glob_min_mn[i,j] = 1 if np.isclose(f(x_opt),0) else 0
-            #print("Monotone norm\n", "Iterations:", n_iter, ", time:", time.time() - start_time, ", f_opt:", f(x_opt))
-            #print("Argmin of f: ", x_opt, ".\n")
+        c = rng.uniform(-10,10)
+        # Initial points for cubic regularization, row j for experiment j, drawn in a single call
+        # and converted once to the floating point type used by the solver
+        X0 = rng.integers(-10,10,size=(nb_experiments,n)).astype(np.float64)
+        problems.append((n, A, c, X0))
+
+    # The experiments are independent and are dispatched to several processes as one flat list of tasks,
+    # each running both methods. The highest dimensions take longest, submitting them first keeps
+    # the processes busy until the end.
+    tasks = product(reversed(range(nb_N)), range(nb_experiments))
+    # Every result is written to the CSV file as soon as it arrives, so that the results of an interrupted run are kept
+    # and the figures can be drawn again with plot_aux_methods without running the experiments
+    with open(csv_path, "w", newline='') as results_fh, \
+            ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(problems,)) as executor:
+        writer = csv.writer(results_fh)
+        writer.writerow(["dim", "trial", "method", "time", "success", "iters"])
+        futures = {executor.submit(_run_pair, i, j): (i, j) for i, j in tasks}
+        for future in as_completed(futures):
+            i, j = futures[future]
+            for aux_method, (elapsed, success, n_iter) in zip(AUX_METHODS, future.result()):
+                writer.writerow([N[i], j, aux_method, elapsed, int(success), n_iter])
+            results_fh.flush()
+
+    plot_aux_methods(csv_path, fig_name, show)
+
+def plot_aux_methods(csv_path="figures/aux_methods.csv", fig_name="aux_methods", show=True):
+    """
+    Plot the comparison of the Trust region and Monotone norm methods from the results written by test_aux_methods.
+    Experiments missing from the file, e.g. after an interrupted run, count as failures.
+    :param csv_path: CSV file with a row per dimension, experiment and method
+    :param fig_name: name of the figure, saved in 'figures' folder
+    :param show: whether to display the figure
+    """
+    with open(csv_path, newline='') as results_fh:
+        rows = list(csv.DictReader(results_fh))
+    # A run interrupted before its first result only wrote the header
+    if not rows:
+        print(RuntimeWarning('No results in '+csv_path+', nothing to plot.'))
+        return
+    N = np.unique([int(row["dim"]) for row in rows])
+    nb_N = N.shape[0]
+    nb_experiments = max(int(row["trial"]) for row in rows)+1
+    time_tr = np.full((nb_N, nb_experiments), -1.)
+    time_mn = np.full((nb_N, nb_experiments), -1.)
+    glob_min_tr = np.zeros((nb_N, nb_experiments), dtype=bool)
+    glob_min_mn = np.zeros((nb_N, nb_experiments), dtype=bool)
+    iters_tr = np.full((nb_N, nb_experiments), -1.)
+    iters_mn = np.full((nb_N, nb_experiments), -1.)
+    results = {"trust_region": (time_tr, glob_min_tr, iters_tr), "monotone_norm": (time_mn, glob_min_mn, iters_mn)}
+    for row in rows:
+        i, j = np.searchsorted(N, int(row["dim"])), int(row["trial"])
+        times, glob_min, iters = results[row["method"]]
+        # Time and iterations are only counted for the experiments that found the global minimum
+        if row["success"] == "1":
+            glob_min[i,j] = True
+            times[i,j] = float(row["time"])
+            iters[i,j] = int(row["iters"])
+
+    for i in range(nb_N):
         time_tr[i][time_tr[i] == -1] = np.max(time_tr[i])
         time_mn[i][time_mn[i] == -1] = np.max(time_mn[i])
         iters_tr[i][iters_tr[i] == -1] = np.max(iters_tr[i])
         iters_mn[i][iters_mn[i] == -1] = np.max(iters_mn[i])
 
-    time_tr = np.average(time_tr, axis=1)
-    time_mn = np.average(time_mn, axis=1)
-    glob_min_tr = np.average(glob_min_tr, axis=1)
-    glob_min_mn = np.average(glob_min_mn, axis=1)
-    iters_tr = np.average(iters_tr, axis=1)
-    iters_mn = np.average(iters_mn, axis=1)
-
-    plt.figure()
-    plt.xticks(N)
-    plt.scatter(N, time_tr, label="Trust region")
-    plt.scatter(N, time_mn, label="Monotone norm", marker='*')
-    plt.xlabel('dimension $k$')
-    plt.ylabel('time (s)')
-    plt.legend(loc='best')
-    plt.title("Time taken with increasing $k$")
-    plt.savefig("figures/time_"+fig_name+".png", format="png")
-    plt.show()
-
-    plt.figure()
-    plt.xticks(N)
-    plt.scatter(N, glob_min_tr, label="Trust region")
-    plt.scatter(N, glob_min_mn, label="Monotone norm", marker='*')
-    plt.xlabel('dimension $k$')
-    plt.ylim(0,1)
-    plt.ylabel('success score')
-    plt.legend(loc='best')
-    plt.title("How often the global minimum is found")
-    plt.savefig("figures/value_"+fig_name+".png", format="png")
-    plt.show()
-
-    plt.figure()
-    plt.xticks(N)
-    plt.scatter(N, iters_tr, label="Trust region")
-    plt.scatter(N, iters_mn, label="Monotone norm", marker='*')
-    plt.xlabel('dimension $k$')
-    plt.ylabel('iterations')
-    plt.legend(loc='best')
-    plt.title("Iterations with increasing $k$")
-    plt.savefig("figures/iterations_"+fig_name+".png", format="png")
-    plt.show()
\ No newline at end of file
+    # Averages over the experiments of each dimension, written into the rows of a single buffer,
+    # the success score being the fraction of experiments that found the global minimum
+    means = np.empty((6, nb_N))
+    time_tr_mean, time_mn_mean, glob_min_tr_mean, glob_min_mn_mean, iters_tr_mean, iters_mn_mean = means
+    np.mean(time_tr, axis=1, out=time_tr_mean)
+    np.mean(time_mn, axis=1, out=time_mn_mean)
+    np.divide(np.count_nonzero(glob_min_tr, axis=1), nb_experiments, out=glob_min_tr_mean)
+    np.divide(np.count_nonzero(glob_min_mn, axis=1), nb_experiments, out=glob_min_mn_mean)
+    np.mean(iters_tr, axis=1, out=iters_tr_mean)
+    np.mean(iters_mn, axis=1, out=iters_mn_mean)
+
+    # Imported here so that running the experiments does not need a display
+    import matplotlib.pyplot as plt
+    # One figure with a subplot per measure, rendered and written once
+    fig, (ax0, ax1, ax2) = plt.subplots(1, 3, figsize=(15, 4))
+    ax0.set_xticks(N)
+    ax0.scatter(N, time_tr_mean, label="Trust region")
+    ax0.scatter(N, time_mn_mean, label="Monotone norm", marker='*')
+    ax0.set_xlabel('dimension $k$')
+    ax0.set_ylabel('time (s)')
+    ax0.legend(loc='best')
+    ax0.set_title("Time taken with increasing $k$")
+
+    ax1.set_xticks(N)
+    ax1.scatter(N, glob_min_tr_mean, label="Trust region")
+    ax1.scatter(N, glob_min_mn_mean, label="Monotone norm", marker='*')
+    ax1.set_xlabel('dimension $k$')
+    ax1.set_ylim(0,1)
+    ax1.set_ylabel('success score')
+    ax1.legend(loc='best')
+    ax1.set_title("How often the global minimum is found")
+
+    ax2.set_xticks(N)
+    ax2.scatter(N, iters_tr_mean, label="Trust region")
+    ax2.scatter(N, iters_mn_mean, label="Monotone norm", marker='*')
+    ax2.set_xlabel('dimension $k$')
+    ax2.set_ylabel('iterations')
+    ax2.legend(loc='best')
+    ax2.set_title("Iterations with increasing $k$")
+
+    fig.tight_layout()
+    fig.savefig("figures/all_"+fig_name+".png", format="png", bbox_inches='tight', dpi=100)
+    if show:
+        plt.show()
+    plt.close(fig)
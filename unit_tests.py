@@ -1,7 +1,9 @@
 import numpy as np
+import scipy.optimize
 import unittest
 
 import src.cubic_reg
+import src.quadratic_obj
 
 
 class TestInitializations(unittest.TestCase):
@@ -83,4 +85,99 @@ class TestHardCase(unittest.TestCase):
         ap = src.cubic_reg._AuxiliaryProblem(x, gradient, hessian, M, lambda_nplus, kappa_easy, 10000)
         s, flag = ap.solve()
         self.assertAlmostEqual(1, s[0]+x[0], places=3)
-        self.assertAlmostEqual(np.sqrt(3), abs(s[1]+x[1]), places=3)
\ No newline at end of file
+        self.assertAlmostEqual(np.sqrt(3), abs(s[1]+x[1]), places=3)
+
+
+class TestSmallEigh(unittest.TestCase):
+    def test_against_lapack(self):
+        rng = np.random.default_rng(0)
+        for n in (1, 2, 3):
+            for _ in range(100):
+                A = rng.standard_normal((n, n))
+                H = (A + A.T)/2
+                Lambda, U = src.cubic_reg._eigh_small(H)
+                self.assertTrue(np.allclose(Lambda, np.linalg.eigvalsh(H)))
+                self.assertTrue(np.allclose(H.dot(U), U*Lambda))
+                self.assertTrue(np.allclose(U.T.dot(U), np.eye(n)))
+
+    def test_repeated_eigenvalues(self):
+        for H in (np.eye(3), np.diag([1., 1., 2.]), np.diag([-1., 2., 2.]), np.diag([3., -3.])):
+            Lambda, U = src.cubic_reg._eigh_small(H)
+            self.assertTrue(np.allclose(Lambda, np.sort(np.diag(H))))
+            self.assertTrue(np.allclose(H.dot(U), U*Lambda))
+
+    def test_extreme_scales(self):
+        rng = np.random.default_rng(0)
+        for n in (1, 2, 3):
+            A = rng.standard_normal((n, n))
+            H0 = (A + A.T)/2
+            Lambda0, U0 = np.linalg.eigh(H0)
+            for scale in (1e-120, 1e-300, 1e110, 1e300):
+                H = scale*H0
+                Lambda, U = src.cubic_reg._eigh_small(H)
+                self.assertTrue(np.allclose(Lambda/scale, Lambda0))
+                self.assertTrue(np.allclose(H0.dot(U), U*Lambda0))
+                self.assertTrue(np.allclose(U.T.dot(U), np.eye(n)))
+
+
+class TestSolveLambdaNewton(unittest.TestCase):
+    def test_small_same_as_numpy(self):
+        rng = np.random.default_rng(0)
+        flags = set()
+        for n in range(1, src.cubic_reg.SCALAR_MAX_DIM+1):
+            for _ in range(200):
+                Lambda = np.sort(rng.standard_normal(n))
+                g_hat = rng.standard_normal(n)
+                M = rng.uniform(0.1, 10)
+                lambduh = max(-Lambda[0], 0)+1e-3
+                s_hat = -g_hat/(Lambda+lambduh)
+                s, flag = src.cubic_reg._solve_lambda_newton(g_hat, Lambda, M, 1e-4, lambduh, s_hat, 100)
+                s_small, flag_small = src.cubic_reg._solve_lambda_newton_small(g_hat, Lambda, M, 1e-4, lambduh, s_hat, 100)
+                self.assertEqual(flag, flag_small)
+                self.assertTrue(np.allclose(s, s_small, rtol=1e-12, atol=1e-12))
+                flags.add(flag)
+        # Both the converged and the not positive definite outcomes are compared
+        self.assertEqual(flags, {0, 1})
+
+
+class TestSolveMonotoneNorm(unittest.TestCase):
+    def test_against_brentq(self):
+        rng = np.random.default_rng(0)
+        for n in (1, 2, 5, 10):
+            for clipped in (False, True):
+                for _ in range(20):
+                    eta = rng.standard_normal(n)
+                    eigvals = np.sort(rng.uniform(0.1, 10, n))
+                    if clipped:
+                        # Non-positive eigenvalues are replaced by 1e-8 before solving
+                        eigvals[0] = 1.0e-08
+                    M = rng.uniform(0.1, 10)
+                    phi = lambda x: np.linalg.norm(eta/(eigvals+3*M*x))-x
+                    # phi(0) > 0 and phi(x) < 0 once 3Mx^2 > ||eta||
+                    root = scipy.optimize.brentq(phi, 0, np.sqrt(np.linalg.norm(eta)/(3*M))+1, xtol=1e-14)
+                    x0 = max(-np.min(eigvals)/(3*M)+1.0e-04, 1.0e-04)
+                    x, iter = src.cubic_reg._solve_monotone_norm(eta, eigvals, M, x0, 1.48e-8, 100)
+                    self.assertAlmostEqual(root, x, places=8)
+
+
+class TestQuadraticObjDerivatives(unittest.TestCase):
+    # Central differences of the objective, with a step for which the truncation and round-off errors stay small
+    def setUp(self):
+        self.h = 1e-4
+
+    def test_against_central_differences(self):
+        rng = np.random.default_rng(0)
+        # For n=2 the only constraint term involves x_0 twice
+        for n in (2, 3, 5, 8):
+            a = rng.uniform(-1, 1, size=(n, n))
+            A = (a + a.T)/2
+            c = rng.uniform(-10, 10)
+            f = src.quadratic_obj.quadratic_obj(n, A, c, lambd=2)
+            grad = src.quadratic_obj.quadratic_obj_grad(n, A, c, lambd=2)
+            hess = src.quadratic_obj.quadratic_obj_hess(n, A, c, lambd=2)
+            x = rng.uniform(-1, 1, n)
+            E = self.h*np.eye(n)
+            grad_fd = np.array([(f(x+e)-f(x-e))/(2*self.h) for e in E])
+            hess_fd = np.array([[(f(x+ei+ej)-f(x+ei-ej)-f(x-ei+ej)+f(x-ei-ej))/(4*self.h**2) for ej in E] for ei in E])
+            self.assertTrue(np.allclose(grad(x), grad_fd, rtol=0, atol=1e-6*np.max(np.abs(grad_fd))))
+            self.assertTrue(np.allclose(hess(x), hess_fd, rtol=0, atol=1e-5*np.max(np.abs(hess_fd))))